@@ -16,6 +16,10 @@ class EngineFixture(fixtures.Fixture, metaclass=abc.ABCMeta):
     test suite may issue commit and rollback requests.
     """
 
+    # Set this if the database is always empty when the fixture is set
+    # up, so that tables can be created without checking for them first.
+    starts_empty = False
+
     @abc.abstractmethod
     def connect(self) -> sa.engine.base.Connection:
         """Return a new connection object from the Engine."""
@@ -26,9 +30,25 @@ class EngineFixture(fixtures.Fixture, metaclass=abc.ABCMeta):
     def has_savepoint(self) -> bool:
         """Define whether the engine can do savepoints or not.
 
-        If an engine fixture cannot do savepoints, it must be torn down
-        and re-made between tests. If it can, it tells the
+        If an engine fixture cannot do savepoints, the database is put
+        back between tests, either with `restore` or by emptying its
+        tables. If it can, it tells the
         DatabaseResource that it supports mid-txn rollbacks via the
         savepoint.
         """
         pass
+
+    def snapshot(self) -> bool:
+        """Save a copy of the database, for `restore`, if possible.
+
+        This is only called for engines that can't do savepoints, just
+        after the tables are created. Returns True if a copy was saved.
+        """
+        return False
+
+    def restore(self, connection: sa.engine.base.Connection) -> None:
+        """Put the database back how it was when `snapshot` was called.
+
+        This is only called if `snapshot` returned True.
+        """
+        pass
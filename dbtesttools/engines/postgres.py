@@ -1,42 +1,687 @@
 # Copyright (c) 2021-2023 Cisco Systems, Inc. and its affiliates
 # All rights reserved.
 
+import abc
+import atexit
+import concurrent.futures
+import fcntl
+import hashlib
+import logging
 import os
+import secrets
+import shutil
 import socket
-import sys
-from contextlib import closing
-from itertools import count
+import subprocess
+import tempfile
+import threading
+import time
+from contextlib import closing, contextmanager
 
 import docker
 import psycopg2
+import psycopg2.pool
 import sqlalchemy as sa
-from retry import retry
 
 from dbtesttools.baseengine import EngineFixture
 
-DEFAULT_INIT_SQL = """
-CREATE DATABASE testing WITH
+log = logging.getLogger(__name__)
+
+# Using the larger non-alpine image causes sort-order errors
+# because of locale collation differences.
+# DEFAULT_IMAGE = 'postgres:11.4'
+DEFAULT_IMAGE = "postgres:16.3-alpine"
+
+CREATE_DATABASE_SQL = """
+CREATE DATABASE {name} WITH
     ENCODING = 'UTF8'
-    LC_COLLATE = 'en_US.utf8'
-    LC_CTYPE = 'en_US.utf8';
-CREATE USER testing WITH ENCRYPTED PASSWORD 'testing';
-GRANT ALL PRIVILEGES ON DATABASE testing TO testing;
+    LC_COLLATE = '{locale}'
+    LC_CTYPE = '{locale}'
+"""
+
+# The user that the fixtures connect as. It's only created if needed, so
+# that it works for every template in a container.
+CREATE_USER_SQL = """
+DO $$
+BEGIN
+    IF NOT EXISTS (SELECT FROM pg_roles WHERE rolname = 'testing') THEN
+        CREATE ROLE testing LOGIN ENCRYPTED PASSWORD 'testing';
+    END IF;
+END
+$$;
+"""
+
+# This runs as the superuser inside the template database, once it has
+# been created and handed over to the testing user.
+DEFAULT_INIT_SQL = """
 GRANT ALL ON SCHEMA public TO testing;
-ALTER DATABASE testing OWNER TO testing;
 """
 
-NEXT_ID = count(1)
+# The test data is thrown away with the container, so durability is
+# pointless. The data directory is also kept in memory, see
+# `_SharedContainer.start_container`.
+SERVER_COMMAND = [
+    "postgres",
+    "-c",
+    "fsync=off",
+    "-c",
+    "synchronous_commit=off",
+    "-c",
+    "full_page_writes=off",
+    # Nothing replicates from the server, so only write the WAL needed
+    # for crash recovery.
+    "-c",
+    "wal_level=minimal",
+    "-c",
+    "max_wal_senders=0",
+]
+
+# GSS and SSL are disabled to skip their negotiation on connect.
+SUPERUSER_DSN = (
+    "host={host} port={port} dbname=postgres user=postgres "
+    "password=postgres connect_timeout=1 gssencmode=disable sslmode=disable"
+)
+
+# Maximum number of superuser connections kept open to a shared container.
+BOOTSTRAP_POOL_SIZE = 4
+
+# Runs fixture set ups in the background, see `setUp_async`.
+_executor = concurrent.futures.ThreadPoolExecutor(
+    thread_name_prefix="dbtesttools"
+)
+
+_docker_client = None
+_docker_client_lock = threading.Lock()
+
+
+def _get_client():
+    """Return the Docker client, which is only made once per process."""
+    global _docker_client
+    if _docker_client is None:
+        with _docker_client_lock:
+            if _docker_client is None:
+                _docker_client = docker.from_env()
+    return _docker_client
+
+
+# Images known to be available locally, so they needn't be checked again.
+_verified_images = set()
+
+
+def _preload_image(image):
+    """Pull `image` if it's not available locally."""
+    try:
+        api = _get_client().api
+        try:
+            api.inspect_image(image)
+        except docker.errors.ImageNotFound:
+            api.pull(image)
+        _verified_images.add(image)
+    except docker.errors.DockerException:
+        # Let the fixture report any problem when it tries again.
+        pass
+
+
+# Setting DBTESTTOOLS_PRELOAD_IMAGE=1 pulls the default image in the
+# background as soon as this module is imported, so that it overlaps with
+# test discovery rather than holding up the first test.
+_image_preload = None
+if os.getenv("DBTESTTOOLS_PRELOAD_IMAGE") == "1":
+    _image_preload = threading.Thread(
+        target=_preload_image, args=(DEFAULT_IMAGE,), daemon=True
+    )
+    _image_preload.start()
+
+
+class _SharedServer:
+    """A Postgres server shared by all the fixtures in this process.
+
+    Each fixture creates its own database in it, copied from a template.
+    Subclasses start the server and set up `pool`, a pool of superuser
+    connections to it, and `superuser_dsn`, which those connections use.
+    """
+
+    # The locale that the template databases are created with.
+    locale = "en_US.utf8"
+
+    def __init__(self):
+        # Maps init SQL to the name of the template database it set up.
+        self.templates = {}
+        self.templates_lock = threading.Lock()
+        # The pool raises instead of blocking when it's exhausted.
+        self.pool_slots = threading.BoundedSemaphore(BOOTSTRAP_POOL_SIZE)
+
+    def make_pool(self, dsn):
+        """Make a pool of superuser connections to the server.
+
+        These are used to create and drop the fixtures' databases, so
+        pooling them saves a connection handshake per fixture.
+        """
+        return psycopg2.pool.ThreadedConnectionPool(
+            1, BOOTSTRAP_POOL_SIZE, dsn
+        )
+
+    @contextmanager
+    def connection(self):
+        """Check out an autocommitting superuser connection from the pool."""
+        with self.pool_slots:
+            c = self.pool.getconn()
+            try:
+                c.set_session(autocommit=True)
+                yield c
+            finally:
+                self.pool.putconn(c, close=bool(c.closed))
+
+    def template_for(self, init_sql):
+        """Return the template database set up by `init_sql`.
+
+        The template is made the first time it's needed. Copying it is
+        much quicker than creating a database from scratch and running
+        the init SQL again. It's named after the SQL so that a reused
+        container's templates are found again by later runs.
+        """
+        with self.templates_lock:
+            template = self.templates.get(init_sql)
+            if template is None:
+                digest = hashlib.sha256(init_sql.encode()).hexdigest()
+                template = "testing_template_{}".format(digest[:12])
+                with self.connection() as c, c.cursor() as cur:
+                    # Other processes sharing a reused container may be
+                    # making the same template.
+                    cur.execute(
+                        "SELECT pg_advisory_lock(hashtext(%s))", (template,)
+                    )
+                    try:
+                        self.create_template(cur, template, init_sql)
+                    finally:
+                        cur.execute(
+                            "SELECT pg_advisory_unlock(hashtext(%s))",
+                            (template,),
+                        )
+                self.templates[init_sql] = template
+            return template
+
+    def create_template(self, cur, template, init_sql):
+        """Create the template database unless it's already there."""
+        cur.execute(
+            "SELECT datistemplate FROM pg_database WHERE datname = %s",
+            (template,),
+        )
+        row = cur.fetchone()
+        if row is not None and row[0]:
+            return
+        # Clear out any half-made template left by a run that died.
+        cur.execute("DROP DATABASE IF EXISTS {}".format(template))
+        cur.execute(
+            CREATE_DATABASE_SQL.format(name=template, locale=self.locale)
+        )
+        cur.execute(CREATE_USER_SQL)
+        cur.execute("ALTER DATABASE {} OWNER TO testing".format(template))
+        # The pool's connections are all to the postgres database, so the
+        # init SQL needs its own connection to the template.
+        c = psycopg2.connect(self.superuser_dsn, dbname=template)
+        with closing(c):
+            c.set_session(autocommit=True)
+            with c.cursor() as init_cur:
+                init_cur.execute(init_sql)
+        cur.execute("ALTER DATABASE {} IS_TEMPLATE true".format(template))
+
+
+class _SharedContainer(_SharedServer):
+    """A Postgres container shared by all the fixtures in this process.
+
+    Bringing up the container is by far the slowest part of the fixture,
+    so it is only done once per process (per set of container
+    parameters). Each fixture then creates its own database inside it.
+    The container is killed when the process exits, unless it is being
+    reused, in which case it is left running for later test runs to pick
+    up again.
+    """
+
+    _lock = threading.Lock()
+    _instances = {}
+
+    def __init__(self, image, name, pg_data, ip_address, host_port, reuse):
+        super().__init__()
+        self.client = _get_client()
+        self.image = image
+        self.name = name
+        self.pg_data = pg_data
+        self.ip_address = ip_address
+        self.host_port = host_port
+        self.reuse = reuse
+
+    @classmethod
+    def ensure(
+        cls, image, name, pg_data, ip_address, host_port=None, reuse=False
+    ):
+        """Return the running shared container, starting it if needed."""
+        key = (image, name, pg_data, ip_address, host_port, reuse)
+        with cls._lock:
+            instance = cls._instances.get(key)
+            if instance is None:
+                instance = cls(
+                    image, name, pg_data, ip_address, host_port, reuse
+                )
+                if reuse:
+                    with instance.reuse_lock():
+                        if not instance.find_container():
+                            instance.start()
+                else:
+                    instance.start()
+                cls._instances[key] = instance
+            return instance
+
+    @property
+    def reusable_name(self):
+        """The name of the reused container, which is the same every run.
+
+        It depends on everything that goes into starting the container,
+        so that a container started with different settings isn't reused.
+        """
+        settings = (self.image, self.pg_data, self.host_port, SERVER_COMMAND)
+        digest = hashlib.sha256(repr(settings).encode()).hexdigest()
+        return "{}-reusable-{}".format(self.name, digest[:12])
+
+    @contextmanager
+    def reuse_lock(self):
+        """Stop other processes racing to start the same reused container."""
+        path = os.path.join(
+            tempfile.gettempdir(), "{}.lock".format(self.reusable_name)
+        )
+        with open(path, "w") as f:
+            # The lock is released when the file is closed.
+            fcntl.flock(f, fcntl.LOCK_EX)
+            yield
+
+    def find_container(self):
+        """Pick up the reused container if an earlier run left it running.
+
+        Returns True if it was found.
+        """
+        api = self.client.api
+        try:
+            attrs = api.inspect_container(self.reusable_name)
+        except docker.errors.NotFound:
+            return False
+        if not attrs["State"]["Running"]:
+            # Get it out of the way so a new one can take its name.
+            api.remove_container(attrs["Id"], force=True)
+            return False
+        log.info("Reusing Postgres container ...")
+        self.use_container(attrs)
+        self.wait_for_pg_start()
+        return True
+
+    def start(self):
+        """Start a new container and wait for Postgres to come up."""
+        self.pull_image()
+        self.start_container()
+        if not self.reuse:
+            atexit.register(self.container.kill)
+        self.wait_for_pg_start()
+
+    def pull_image(self):
+        if _image_preload is not None:
+            _image_preload.join()
+        if self.image in _verified_images:
+            return
+        # The low-level API is used for the container set up as the
+        # high-level one makes extra requests to build its model objects.
+        try:
+            self.client.api.inspect_image(self.image)
+        except docker.errors.ImageNotFound:
+            log.info("Pulling Postgres image ...")
+            self.client.api.pull(self.image)
+        _verified_images.add(self.image)
+
+    def start_container(self):
+        env = dict(POSTGRES_PASSWORD="postgres", PGDATA=self.pg_data)  # noqa: S106
+        log.info("Starting Postgres container ...")
+        api = self.client.api
+        host_config = api.create_host_config(
+            auto_remove=True,
+            network_mode="bridge",
+            # Unless a port was given, let Docker pick a free one, so that
+            # nothing else can grab it between us choosing it and the
+            # container starting.
+            port_bindings={5432: self.host_port},
+            tmpfs={self.pg_data: "rw,size=512m"},
+        )
+        if self.reuse:
+            name = self.reusable_name
+        else:
+            # Uniq-ify the name as several processes may each start a
+            # container.
+            name = "{}-{}-{}".format(
+                self.name, os.getpid(), secrets.token_hex(4)
+            )
+        container_id = api.create_container(
+            self.image,
+            command=SERVER_COMMAND,
+            detach=True,
+            environment=env,
+            host_config=host_config,
+            name=name,
+            ports=[5432],
+        )["Id"]
+        api.start(container_id)
+        self.use_container(api.inspect_container(container_id))
+
+    def use_container(self, attrs):
+        """Point at the container described by `attrs`."""
+        self.container = self.client.containers.prepare_model(attrs)
+        bindings = attrs["NetworkSettings"]["Ports"]
+        self.local_port = int(bindings["5432/tcp"][0]["HostPort"])
+        self.superuser_dsn = SUPERUSER_DSN.format(
+            host=self.ip_address, port=self.local_port
+        )
+        log.info("Using port %s", self.local_port)
+
+    def wait_for_pg_start(self, timeout=60):
+        """Wait until the server accepts connections, for up to `timeout`s."""
+        deadline = time.monotonic() + timeout
+        self.wait_for_ready_log(timeout)
+        # The image's entrypoint runs a temporary server (which doesn't
+        # listen on TCP) to initialise the database, and that logs the
+        # same line, so confirm with a real connection over TCP.
+        delay = 0.02
+        while True:
+            try:
+                # A bare TCP connection is much cheaper to try than a
+                # Postgres one.
+                socket.create_connection(
+                    (self.ip_address, self.local_port), timeout=0.2
+                ).close()
+                # The pool opens its first connection straight away.
+                self.pool = self.make_pool(self.superuser_dsn)
+            except (OSError, psycopg2.OperationalError):
+                if time.monotonic() + delay > deadline:
+                    raise
+                time.sleep(delay)
+                delay = min(delay * 1.5, 1)
+            else:
+                break
+        log.info("Postgres is up")
+
+    def wait_for_ready_log(self, timeout):
+        """Follow the container's log until Postgres says it's ready."""
+        logs = self.container.logs(stream=True, follow=True)
+        timer = threading.Timer(timeout, logs.close)
+        timer.start()
+        try:
+            seen = b""
+            for chunk in logs:
+                # Keep a little of the previous chunk in case the line is
+                # split across two of them.
+                seen = seen[-64:] + chunk
+                if b"ready to accept connections" in seen:
+                    break
+        except Exception:
+            # Reading from the stream can blow up if the timer closed it,
+            # in which case the connection check reports the failure.
+            if timer.is_alive():
+                raise
+        finally:
+            timer.cancel()
+            logs.close()
+
+
+class _SharedLocalServer(_SharedServer):
+    """A Postgres server run directly on this host, shared by the process.
+
+    The server's files go in a temporary directory, and it only listens on
+    a Unix socket in there. It's stopped, and the directory removed, when
+    the process exits.
+    """
+
+    # Unlike en_US, this is available wherever glibc is.
+    locale = "C.UTF-8"
+
+    _lock = threading.Lock()
+    _instances = {}
+    # Why the server failed to start, so that it's not tried again by
+    # every fixture.
+    _failures = {}
+
+    def __init__(self, bin_dir):
+        super().__init__()
+        self.bin_dir = bin_dir
+
+    @classmethod
+    def ensure(cls, bin_dir=None):
+        """Return the running shared server, starting it if needed."""
+        with cls._lock:
+            failure = cls._failures.get(bin_dir)
+            if failure is not None:
+                raise RuntimeError(
+                    "Postgres failed to start earlier in this process"
+                ) from failure
+            instance = cls._instances.get(bin_dir)
+            if instance is None:
+                instance = cls(bin_dir)
+                try:
+                    instance.start()
+                except Exception as e:
+                    cls._failures[bin_dir] = e
+                    raise
+                cls._instances[bin_dir] = instance
+            return instance
+
+    def run(self, program, *args):
+        """Run one of the Postgres programs.
+
+        Raises RuntimeError, with what the program printed, if it fails.
+        """
+        if self.bin_dir is not None:
+            program = os.path.join(self.bin_dir, program)
+        try:
+            subprocess.run([program, *args], check=True, capture_output=True)  # noqa: S603
+        except subprocess.CalledProcessError as e:
+            raise RuntimeError(
+                "{} failed: {}".format(
+                    program, e.stderr.decode(errors="replace").strip()
+                )
+            ) from e
+
+    def start(self):
+        # /dev/shm is often too small to hold a cluster, and with fsync
+        # off the server rarely waits on the disk anyway.
+        self.socket_dir = tempfile.mkdtemp(prefix="pgtest-")
+        atexit.register(shutil.rmtree, self.socket_dir, ignore_errors=True)
+        pg_data = os.path.join(self.socket_dir, "data")
+        log.info("Initialising Postgres ...")
+        self.run(
+            "initdb",
+            "--pgdata",
+            pg_data,
+            "--username",
+            "postgres",
+            "--auth",
+            "trust",
+            "--encoding",
+            "UTF8",
+            "--locale",
+            self.locale,
+            "--no-sync",
+        )
+        options = [
+            "-c",
+            "listen_addresses=''",
+            "-k",
+            self.socket_dir,
+            *SERVER_COMMAND[1:],
+        ]
+        # The log file is needed so that the server doesn't hold on to
+        # pg_ctl's output, which `run` waits to be closed.
+        self.run(
+            "pg_ctl",
+            "start",
+            "--wait",
+            "--pgdata",
+            pg_data,
+            "--log",
+            os.path.join(self.socket_dir, "postgres.log"),
+            "-o",
+            " ".join(options),
+        )
+        atexit.register(
+            self.run, "pg_ctl", "stop", "--pgdata", pg_data, "-m", "immediate"
+        )
+        self.superuser_dsn = SUPERUSER_DSN.format(
+            host=self.socket_dir, port=5432
+        )
+        self.pool = self.make_pool(self.superuser_dsn)
+        log.info("Postgres is up")
+
+
+class _PostgresFixture(EngineFixture):
+    """The parts common to the Postgres fixtures.
+
+    Each fixture gets its own database, copied from a template database,
+    in a server that is shared by the whole process. The database is
+    dropped when the fixture is cleaned up. Subclasses provide the
+    server.
+    """
+
+    # starts_empty is left off because the init SQL may have put tables
+    # in the template.
+
+    def __init__(
+        self,
+        init_sql,
+        isolation,
+        future,
+        pool_size,
+        max_overflow,
+        pool_pre_ping,
+        pool_recycle,
+    ):
+        super().__init__()
+        if init_sql is None:
+            init_sql = DEFAULT_INIT_SQL
+        self.init_sql = init_sql
+        self.isolation = isolation
+        self.future = future
+        self.pool_size = pool_size
+        self.max_overflow = max_overflow
+        self.pool_pre_ping = pool_pre_ping
+        self.pool_recycle = pool_recycle
+
+    def connect(self):
+        """Return a connection object from the engine."""
+        return self.engine.connect()
+
+    @property
+    def has_savepoint(self):
+        # PG can roll back transactions, so is never dirty.
+        return True
+
+    def setUp_async(self):
+        """Set up the fixture in a background thread.
+
+        Returns a `concurrent.futures.Future` which completes when the
+        fixture is ready. Use this to bring up several fixtures
+        concurrently, e.g. with `concurrent.futures.wait`.
+        """
+        return _executor.submit(self.setUp)
+
+    @classmethod
+    def prewarm(cls, **kwargs):
+        """Start the shared server in a background thread.
+
+        Call this as early as possible, e.g. from `load_tests` or a
+        session-scoped fixture, with the same arguments that the fixtures
+        will be given. The server and its template database are then
+        made while the tests are being collected, rather than holding up
+        the first test. Returns a `concurrent.futures.Future` which
+        completes when the server is ready.
+        """
+        fixture = cls(**kwargs)
+
+        def warm():
+            fixture.shared_server().template_for(fixture.init_sql)
 
+        return _executor.submit(warm)
 
-class PostgresContainerFixture(EngineFixture):
+    # Internal methods below here.
+
+    @abc.abstractmethod
+    def shared_server(self):
+        """Return the `_SharedServer`, starting it if needed."""
+
+    @abc.abstractmethod
+    def engine_url(self):
+        """Return the URL of the fixture's database."""
+
+    def setUp(self):
+        """Do all the work to bring up a working Postgres fixture."""
+        super().setUp()
+        self.shared = self.shared_server()
+        self.db_name = "testing_{}_{}".format(
+            os.getpid(), secrets.token_hex(4)
+        )
+        self.set_up_test_database()
+        self.addCleanup(self.drop_test_database)
+        self.engine = sa.create_engine(
+            self.engine_url(),
+            isolation_level=self.isolation,
+            future=self.future,
+            pool_pre_ping=self.pool_pre_ping,
+            **self.pool_kwargs(),
+        )
+        self.addCleanup(self.engine.dispose)
+
+    def pool_kwargs(self):
+        """Return the optional pool args for `create_engine`."""
+        kwargs = dict(
+            pool_size=self.pool_size,
+            max_overflow=self.max_overflow,
+            pool_recycle=self.pool_recycle,
+        )
+        return {k: v for k, v in kwargs.items() if v is not None}
+
+    def set_up_test_database(self):
+        template = self.shared.template_for(self.init_sql)
+        with self.shared.connection() as c, c.cursor() as cur:
+            cur.execute(
+                "CREATE DATABASE {} TEMPLATE {} OWNER testing".format(
+                    self.db_name, template
+                )
+            )
+
+    def drop_test_database(self):
+        with self.shared.connection() as c, c.cursor() as cur:
+            # Kick out any connections that are still open, otherwise the
+            # drop will fail.
+            cur.execute(
+                "SELECT pg_terminate_backend(pid) FROM pg_stat_activity "
+                "WHERE datname = %s",
+                (self.db_name,),
+            )
+            cur.execute("DROP DATABASE IF EXISTS {}".format(self.db_name))
+
+
+class PostgresContainerFixture(_PostgresFixture):
     """A Postgres Docker-based database fixture.
 
+    A single container is started the first time the fixture is set up
+    and is then shared by every fixture in the same process (it is killed
+    when the process exits). Each fixture gets its own database inside
+    the container, copied from a template database, which is dropped when
+    the fixture is cleaned up.
+
     :param image: Name of the postgres docker image to pull and use.
     :param name: base name prefix for all started container instances.
-    :param init_sql: Optional string of SQL to run in the newly-created
-        database. Defaults to setting up a database/user called 'testing'
-        with UTF8 encoding and collation.
-    :param pg_data: PGDATA to pass to the container, defaults to /tmp/pgdata
+    :param init_sql: Optional string of SQL to run, once per container,
+        in the template database that every fixture's database is copied
+        from. By then the template (with UTF8 encoding and collation)
+        exists and is owned by the user/password 'testing'/'testing'
+        that the fixture connects as. The SQL is run as the postgres
+        superuser, so use it to add extensions, schema or data, granting
+        anything it creates to 'testing'. It is sent to the server in one
+        go. Defaults to granting 'testing' the public schema.
+    :param pg_data: PGDATA to pass to the container, defaults to /tmp/pgdata.
+        A tmpfs is mounted there so that the data is kept in memory.
     :param isolation: Optional default isolation level to use in the database.
     :param future: Passed directly to SQLAlchemy's `create_engine`.
         If true, activates the v2 API. Defaults to False.
@@ -48,121 +693,128 @@ class PostgresContainerFixture(EngineFixture):
         container's host. The DBTESTTOOLS_PG_IP_ADDR environment
         variable can also be used to override (this arg takes precedence
         though).
+    :param port: The host port to publish Postgres on, for when it must be
+        known in advance. Defaults to a free port picked by Docker. Only
+        one container can publish on a given port, so each test process
+        can't start its own. When stestr runs a worker per CPU, either
+        run a single worker (--concurrency 1) or also set
+        `reuse_container` so that the workers share one container.
+    :param reuse_container: If true, the container is left running when
+        the process exits, and later test runs (and other processes)
+        with the same settings use it instead of starting their own.
+        This saves the container's start up time on every run after the
+        first. Setting the DBTESTTOOLS_PG_REUSE_CONTAINER environment
+        variable to 1 does the same. Kill the container to get rid of it.
+    :param pool_size: Passed to `create_engine`. Defaults to 10, double
+        SQLAlchemy's default, so that tests with many sessions open at
+        once don't wait on the pool. None uses SQLAlchemy's default.
+    :param max_overflow: Passed to `create_engine`. Defaults to 20. None
+        uses SQLAlchemy's default.
+    :param pool_pre_ping: Passed to `create_engine`. Defaults to False, as
+        the server never goes away during the fixture's lifetime.
+    :param pool_recycle: Passed to `create_engine` if set. The default of
+        never recycling connections suits the short-lived test database.
     """
 
     def __init__(
         self,
-        # Using the larger non-alpine image causes sort-order errors
-        # because of locale collation differences.
-        # image='postgres:11.4',
-        image="postgres:16.3-alpine",
+        image=DEFAULT_IMAGE,
         name="testdb",
         init_sql=None,
         pg_data="/tmp/pgdata",  # noqa: S108
         isolation=None,
         future=False,
         ip_address=None,
+        port=None,
+        reuse_container=False,
+        pool_size=10,
+        max_overflow=20,
+        pool_pre_ping=False,
+        pool_recycle=None,
     ):
-        super().__init__()
+        super().__init__(
+            init_sql,
+            isolation,
+            future,
+            pool_size,
+            max_overflow,
+            pool_pre_ping,
+            pool_recycle,
+        )
         self.image = image
         self.name = name
-        if init_sql is None:
-            init_sql = DEFAULT_INIT_SQL
-        self.init_sql = init_sql
         self.pg_data = pg_data
-        self.isolation = isolation
-        self.future = future
         self.ip_address = ip_address or os.getenv(
             "DBTESTTOOLS_PG_IP_ADDR", "127.0.0.1"
         )
+        self.port = port
+        self.reuse_container = reuse_container or (
+            os.getenv("DBTESTTOOLS_PG_REUSE_CONTAINER") == "1"
+        )
 
-    def connect(self):
-        """Return a connection object from the engine."""
-        return self.engine.connect()
+    def shared_server(self):
+        shared = _SharedContainer.ensure(
+            self.image,
+            self.name,
+            self.pg_data,
+            self.ip_address,
+            self.port,
+            self.reuse_container,
+        )
+        self.client = shared.client
+        self.container = shared.container
+        self.local_port = shared.local_port
+        return shared
 
-    @property
-    def has_savepoint(self):
-        # PG can roll back transactions, so is never dirty.
-        return True
+    def engine_url(self):
+        return "postgresql://testing:testing@{ip}:{port}/{name}".format(
+            name=self.db_name, ip=self.ip_address, port=self.local_port
+        )
 
-    # Internal methods below here.
 
-    def setUp(self):
-        """Do all the work to bring up a working Postgres fixture."""
-        super().setUp()
-        self.client = docker.from_env()
-        self.pull_image()
-        self.find_free_port()
-        self.start_container()
-        self.wait_for_pg_start()
-        self.set_up_test_database()
-        self.engine = sa.create_engine(
-            "postgresql://testing:testing@{ip}:{port}/testing".format(
-                ip=self.ip_address, port=self.local_port
-            ),
-            isolation_level=self.isolation,
-            future=self.future,
-        )
-        self.addCleanup(self.container.kill)
+class PostgresEphemeralFixture(_PostgresFixture):
+    """A Postgres database fixture that doesn't need Docker.
 
-    def pull_image(self):
-        try:
-            self.client.images.get(self.image)
-        except docker.errors.ImageNotFound:
-            print("Pulling Postgres image ...", file=sys.stderr)
-            self.client.images.pull(self.image)
+    A single Postgres server is initialised and started straight from the
+    Postgres programs installed on this host, the first time the fixture
+    is set up. It is then shared by every fixture in the same process and
+    is stopped when the process exits. Postgres refuses to run as root.
 
-    def start_container(self):
-        env = dict(POSTGRES_PASSWORD="postgres", PGDATA=self.pg_data)  # noqa: S106
-        ports = {"5432": self.local_port}
-        print("Starting Postgres container ...", file=sys.stderr)
-        # Uniq-ify the name as threaded tests will create multiple containers.
-        name = "{}-{}.{}".format(self.name, os.getpid(), next(NEXT_ID))
-        self.container = self.client.containers.run(
-            self.image,
-            detach=True,
-            auto_remove=True,
-            environment=env,
-            name=name,
-            network_mode="bridge",
-            ports=ports,
-            remove=True,
-        )
+    :param bin_dir: The directory holding `initdb` and `pg_ctl`, which
+        may not be on the PATH (e.g. /usr/lib/postgresql/16/bin on
+        Debian). The DBTESTTOOLS_PG_BIN_DIR environment variable can also
+        be used to set it. Defaults to finding them on the PATH.
 
-    def find_free_port(self):
-        """Find a free port on which to run Postgres locally."""
-        # This initially binds to port 0, which makes the kernel pick a
-        # real free port. We close the socket after determnining which port
-        # that was.
-        with closing(socket.socket(socket.AF_INET, socket.SOCK_STREAM)) as s:
-            s.bind(("localhost", 0))
-            s.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-            self.local_port = s.getsockname()[1]
-            print("Using port {}".format(self.local_port), file=sys.stderr)
+    The other parameters are the same as `PostgresContainerFixture`'s.
+    """
 
-    def set_up_test_database(self):
-        c = psycopg2.connect(
-            "dbname='postgres' "
-            "user='postgres' host='{ip}' port='{port}' "
-            "password='postgres' connect_timeout=1".format(
-                ip=self.ip_address, port=self.local_port
-            )
+    def __init__(
+        self,
+        init_sql=None,
+        isolation=None,
+        future=False,
+        bin_dir=None,
+        pool_size=10,
+        max_overflow=20,
+        pool_pre_ping=False,
+        pool_recycle=None,
+    ):
+        super().__init__(
+            init_sql,
+            isolation,
+            future,
+            pool_size,
+            max_overflow,
+            pool_pre_ping,
+            pool_recycle,
         )
-        c.autocommit = True
-        cur = c.cursor()
-        for stmt in self.init_sql.split(";"):
-            if stmt.strip():
-                cur.execute(stmt)
-        cur.close()
-        c.close()
-
-    @retry(psycopg2.OperationalError, tries=30, delay=1)
-    def wait_for_pg_start(self):
-        c = psycopg2.connect(
-            "user='postgres' host='{ip}' port='{port}'"
-            "password='postgres' connect_timeout=1".format(
-                ip=self.ip_address, port=self.local_port
-            )
+        self.bin_dir = bin_dir or os.getenv("DBTESTTOOLS_PG_BIN_DIR")
+
+    def shared_server(self):
+        return _SharedLocalServer.ensure(self.bin_dir)
+
+    def engine_url(self):
+        # The server only listens on its Unix socket.
+        return "postgresql://testing:testing@/{name}?host={host}".format(
+            name=self.db_name, host=self.shared.socket_dir
         )
-        c.close()
-        print("Postgres is up", file=sys.stderr)
@@ -1,33 +1,80 @@
 # Copyright (c) 2021 Cisco Systems, Inc. and its affiliates
 # All rights reserved.
 
+import secrets
+import sqlite3
+
 import sqlalchemy as sa
 
 from dbtesttools.baseengine import EngineFixture
 
+# A named in-memory database, which other connections can also open.
+URL = 'sqlite+pysqlite:///file:{name}?mode=memory&cache=shared&uri=true'
+
 
 class SqliteMemoryFixture(EngineFixture):
     """A Sqlite memory-based DB fixture.
 
     :param future: The future flag passed directly to SQLAlchemy's
         `create_engine`.
+    :param sqlite_name: The name of the in-memory database. Fixtures that
+        use the same name share the same database while any of them are
+        set up. Defaults to a random name, so that each fixture has its
+        own. (It isn't called `name`, as that is the container prefix for
+        `PostgresContainerFixture` and may be passed here too.)
 
     Throw all other args/kwargs on the floor.
     (For compatibility with PyCharm's built-in test runner)
     """
 
-    def __init__(self, *args, future=False, **kwargs):
+    def __init__(self, *args, future=False, sqlite_name=None, **kwargs):
         self.future = future
+        self.name = sqlite_name or secrets.token_hex(8)
+        # Another fixture may have already made the tables in a named
+        # database.
+        self.starts_empty = sqlite_name is None
         super().__init__()
 
     def setUp(self):
         super().setUp()
+        # A memory DB only exists while a connection to it is open, so
+        # every connection from the engine must share the same one.
         self.engine = sa.create_engine(
-            'sqlite:///:memory:', future=self.future
+            URL.format(name=self.name),
+            future=self.future,
+            poolclass=sa.pool.StaticPool,
+            connect_args={'check_same_thread': False, 'uri': True},
         )
-        self.connection = self.connect()
-        self.connection.execute(sa.text('PRAGMA foreign_keys = ON'))
-        self.addCleanup(self.connection.close)
+        sa.event.listen(self.engine, 'connect', self.set_pragmas)
+        # Closing the pool's connection frees the memory DB, unless
+        # another fixture shares it.
+        self.addCleanup(self.engine.dispose)
+
+    @staticmethod
+    def set_pragmas(dbapi_connection, connection_record):
+        # Pragmas are per-connection, so set them on every new one.
+        cursor = dbapi_connection.cursor()
+        cursor.execute('PRAGMA foreign_keys = ON')
+        # Keep temporary tables and indices in memory too. An in-memory
+        # database's journal already is, and it has nothing to sync.
+        cursor.execute('PRAGMA temp_store = MEMORY')
+        cursor.close()
+
+    def snapshot(self):
+        # SQLite's backup API copies the whole database in one call,
+        # which is quicker than deleting the rows from every table. It
+        # can't be used on a database shared with other fixtures, as
+        # restoring it would wipe out their tables too.
+        if not self.starts_empty:
+            return False
+        self._snapshot = sqlite3.connect(':memory:', check_same_thread=False)
+        self.addCleanup(self._snapshot.close)
+        with self.engine.connect() as connection:
+            connection.connection.driver_connection.backup(self._snapshot)
+        return True
+
+    def restore(self, connection):
+        self._snapshot.backup(connection.connection.driver_connection)
 
     def connect(self):
         """Return a connection object from the engine."""
@@ -35,7 +82,7 @@ class SqliteMemoryFixture(EngineFixture):
 
     @property
     def has_savepoint(self):
-        # This forces the database reasource to be rebuilt for every test.
-        # Sqlite won't do nested transactions properly, so just throw the DB
-        # away and start again.
+        # This makes the database resource restore the database after
+        # every test. Sqlite won't do nested transactions properly, so the
+        # test's commits can't just be rolled back.
         return False
@@ -1,17 +1,58 @@
 # Copyright (c) 2021 Cisco Systems, Inc. and its affiliates
 # All rights reserved.
 
+import concurrent.futures
+import functools
 import importlib
+import inspect
 import itertools
+import logging
 import os
 import pkgutil
-import sys
 
 import fixtures
 import sqlalchemy as sa
 import testresources
 
-models_loaded = False
+from dbtesttools.baseengine import EngineFixture
+
+log = logging.getLogger(__name__)
+
+# SQLAlchemy 2 sessions can keep their own transactions in savepoints.
+JOIN_WITH_SAVEPOINT = int(sa.__version__.split(".")[0]) >= 2
+
+# Maps the names of the available engine fixtures to their classes, see
+# `_engine_fixtures`.
+_engine_registry = None
+
+
+def _engine_fixtures():
+    """Return the engine fixtures in the engines package, by name.
+
+    The package is only searched the first time this is called.
+    """
+    global _engine_registry
+    if _engine_registry is None:
+        import dbtesttools.engines
+
+        registry = {}
+        for _, module, _ in pkgutil.iter_modules(dbtesttools.engines.__path__):
+            mod = importlib.import_module(f"dbtesttools.engines.{module}")
+            for obj in mod.__dict__.values():
+                if (
+                    isinstance(obj, type)
+                    and issubclass(obj, EngineFixture)
+                    and not inspect.isabstract(obj)
+                ):
+                    registry[obj.__name__] = obj
+        _engine_registry = registry
+    return _engine_registry
+
+
+@functools.lru_cache(maxsize=None)
+def _import_models(module_name):
+    """Import a models module, just once per process."""
+    importlib.import_module(module_name)
 
 
 class DatabaseResource(testresources.TestResourceManager):
@@ -42,7 +83,8 @@ class DatabaseResource(testresources.TestResourceManager):
         under the engines module and automatically imported. Must be a
         concrete instance of `EngineFixture`. Raises AttributeError if the
         name is not found. Currently available engines are
-        'SqliteMemoryFixture' and 'PostgresContainerFixture'.
+        'SqliteMemoryFixture', 'PostgresContainerFixture' and
+        'PostgresEphemeralFixture'.
         NOTE: This can be overridden by setting the TEST_ENGINE_FIXTURE
         environment variable.
 
@@ -84,9 +126,12 @@ class DatabaseResource(testresources.TestResourceManager):
         self.engine_fixture_kwargs = engine_fixture_kwargs or {}
         self.future = future
         self.engine_fixture_kwargs["future"] = self.future
+        # Tables in the order their rows can be deleted, see
+        # `clear_tables`.
+        self._tables_to_clear = None
 
     def make(self, dep_resources):
-        print("Creating new database resource...", file=sys.stderr)
+        log.info("Creating new database resource...")
         self.initialize_engine()
         return self
 
@@ -100,27 +145,45 @@ class DatabaseResource(testresources.TestResourceManager):
         return self.db.has_savepoint
 
     def clean(self, resource):
-        print("Cleaning up database resource...", file=sys.stderr)
+        log.info("Cleaning up database resource...")
         self.db.cleanUp()
+        self.db = None
 
     def pick_engine_fixture(self):
         env_name = os.environ.get("TEST_ENGINE_FIXTURE", None)
         if env_name is not None:
             self.engine_fixture_name = env_name
-        import dbtesttools.engines
-
-        for _, module, _ in pkgutil.iter_modules(dbtesttools.engines.__path__):
-            mod = importlib.import_module(f"dbtesttools.engines.{module}")
-
-            for name, obj in mod.__dict__.items():
-                if name == self.engine_fixture_name:
-                    return obj(**self.engine_fixture_kwargs)
-        raise AttributeError(f"{self.engine_fixture_name} not found")
+        try:
+            engine_fixture = _engine_fixtures()[self.engine_fixture_name]
+        except KeyError:
+            raise AttributeError(
+                f"{self.engine_fixture_name} not found"
+            ) from None
+        return engine_fixture(**self.engine_fixture_kwargs)
 
     def initialize_engine(self):
         self.db = self.pick_engine_fixture()
 
-        self.db.setUp()
+        # Nothing else needs the database until the tables are created,
+        # so bring it up in the background while the rest is done here.
+        # The models are imported on this thread in case importing them
+        # has side effects that expect to be on the main thread.
+        with concurrent.futures.ThreadPoolExecutor(max_workers=1) as pool:
+            db_ready = pool.submit(self.db.setUp)
+            try:
+                self.load_models()
+                self.make_session_registry()
+            except Exception:
+                # Nothing else will clean up the database once this fails.
+                if db_ready.exception() is None:
+                    self.db.cleanUp()
+                raise
+            db_ready.result()
+
+        self.create_tables(self.db.engine)
+        self._snapshot_taken = not self.db.has_savepoint and self.db.snapshot()
+
+    def make_session_registry(self):
         self._session_id_iterator = itertools.count(1)
         self._session_id = next(self._session_id_iterator)
         if self.sessionmaker_class is not None:
@@ -142,18 +205,9 @@ class DatabaseResource(testresources.TestResourceManager):
         if self.patch_query_property:
             self.ModelBase.query = self.Session.query_property()
 
-        self.load_models()
-        self.create_tables(self.db.engine)
-
-    def _load_models(self):
-        importlib.import_module(self.models_module)
-
     def load_models(self):
         """Load DB models just once, across all threads."""
-        global models_loaded
-        if models_loaded is False:
-            models_loaded = True
-            self._load_models()
+        _import_models(self.models_module)
 
     @property
     def engine(self):
@@ -174,25 +228,38 @@ class DatabaseResource(testresources.TestResourceManager):
 
     def create_tables(self, engine):
         metadata = self.ModelBase.metadata
-        metadata.create_all(bind=engine)
+        # Checking for each table first costs a query per table.
+        metadata.create_all(bind=engine, checkfirst=not self.db.starts_empty)
 
     def rollback_transaction(self, txn):
         """Roll back an in-progress transaction.
 
         If the database supports savepoints, this is trivial.
-        If it does not, the database is blown away and recreated.
+        If it does not, anything the test committed is still there, so
+        the database is restored from the snapshot taken when the tables
+        were created or, if the engine couldn't take one, every table is
+        emptied.
         """
+        txn.rollback()
         if not self.db.has_savepoint:
-            # The DB Fixture can't do rollbacks, blow away the whole fixture
-            # and recreate.
-            if self.db._cleanups:
-                # Work around bug in Fixtures by checking for any cleanups
-                # first.
-                self.db.cleanUp()
-            self.initialize_engine()
-        else:
-            # The DB fixture can do rollbacks.
-            txn.rollback()
+            if self._snapshot_taken:
+                self.db.restore(txn.connection)
+            else:
+                self.clear_tables(txn.connection)
+
+    def clear_tables(self, connection):
+        """Delete all the rows in the database's tables.
+
+        This is much quicker than dropping and recreating the tables.
+        Child tables are done first so that foreign keys are satisfied.
+        """
+        if self._tables_to_clear is None:
+            self._tables_to_clear = list(
+                reversed(self.ModelBase.metadata.sorted_tables)
+            )
+        with connection.begin():
+            for table in self._tables_to_clear:
+                connection.execute(table.delete())
 
 
 class SessionFixture(fixtures.Fixture):
@@ -225,13 +292,16 @@ class SessionFixture(fixtures.Fixture):
             self.database.engine.echo = True
             from logging import Formatter, getLogger
 
-            log = getLogger("sqlalchemy.engine.Engine")
-            log.handlers[0].setFormatter(
+            sa_log = getLogger("sqlalchemy.engine.Engine")
+            sa_log.handlers[0].setFormatter(
                 Formatter("[%(levelname)s] %(message)s")
             )
 
     def setUp(self):
         super().setUp()
+        # Remember which engine fixture the connection came from, see
+        # `clean_session`.
+        self.db = self.database.db
         self.connection = self.database.connect()
         self.txn = self.connection.begin()
         self.configure_session()
@@ -246,8 +316,14 @@ class SessionFixture(fixtures.Fixture):
         """Set up a pre-configured Session factory object."""
         if self.future:
             # v2 API binds via the connection
+            kwargs = {}
+            if JOIN_WITH_SAVEPOINT:
+                # The session puts everything it does in a savepoint, so
+                # commits and rollbacks in tests never touch the outer
+                # transaction.
+                kwargs["join_transaction_mode"] = "create_savepoint"
             self.database.Session.configure(
-                future=self.future, bind=self.connection
+                future=self.future, bind=self.connection, **kwargs
             )
         # v1 API binds via the engine
         else:
@@ -268,6 +344,9 @@ class SessionFixture(fixtures.Fixture):
         # isolation, and the inner savepoint is automatically recreated
         # if any test commits or rolls back. This ensures that the outer
         # txn is never touched by tests (or code called by tests).
+        if self.future and JOIN_WITH_SAVEPOINT:
+            # The session does this itself, see `configure_session`.
+            return
         if self.future:
             # V2 API uses connections for nesting
             self.start_savepoint()
@@ -275,14 +354,17 @@ class SessionFixture(fixtures.Fixture):
             # V1 API uses sessions for nesting
             self.session.begin_nested()
 
-        @sa.event.listens_for(self.session, "after_transaction_end")
-        def restart_savepoint(session, transaction):
-            if self.future:
-                if not self.savepoint.is_active:
-                    self.start_savepoint()
-            elif transaction.nested and not transaction._parent.nested:
-                session.expire_all()
-                session.begin_nested()
+        sa.event.listen(
+            self.session, "after_transaction_end", self.restart_savepoint
+        )
+
+    def restart_savepoint(self, session, transaction):
+        if self.future:
+            if not self.savepoint.is_active:
+                self.start_savepoint()
+        elif transaction.nested and not transaction._parent.nested:
+            session.expire_all()
+            session.begin_nested()
 
     def start_savepoint(self):
         # In SQLAlchemy v2 API, commiting a session with an active
@@ -293,6 +375,14 @@ class SessionFixture(fixtures.Fixture):
         self.savepoint = self.connection.begin_nested()
 
     def clean_session(self):
+        if self.database.db is not self.db:
+            # Unless the tests are run in an OptimisingTestSuite,
+            # testresources cleans up the database resource in the test's
+            # tearDown, which is before this runs. The connection has
+            # gone with it, so there is nothing left to roll back. Drop
+            # the connection rather than leave it checked out.
+            self.connection.invalidate()
+            return
         try:
             self.session.close()
         except sa.exc.OperationalError:
@@ -301,6 +391,13 @@ class SessionFixture(fixtures.Fixture):
             # rollback.  We can safely ignore as we're about to roll back
             # the outer transaction anyway.
             pass
+        # Don't leave the session holding on to this fixture.
+        if sa.event.contains(
+            self.session, "after_transaction_end", self.restart_savepoint
+        ):
+            sa.event.remove(
+                self.session, "after_transaction_end", self.restart_savepoint
+            )
         self.database.rollback_transaction(self.txn)
         # Return connection to Engine's pool.
         self.connection.close()
@@ -9,3 +9,13 @@ class TestModel(ModelBase):
     id = sa.Column(sa.Integer, primary_key=True)
     name = sa.Column(sa.String)
     value = sa.Column(sa.Integer)
+
+
+# Tables made by a second fixture sharing a SQLite database with the first.
+OtherModelBase = declarative_base()
+
+
+class OtherModel(OtherModelBase):
+    __tablename__ = "other_model"
+    id = sa.Column(sa.Integer, primary_key=True)
+    name = sa.Column(sa.String)
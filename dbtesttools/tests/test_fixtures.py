@@ -0,0 +1,50 @@
+import unittest
+
+import sqlalchemy as sa
+
+from dbtesttools.fixtures import DatabaseResource, SessionFixture
+from dbtesttools.tests.models import ModelBase
+
+
+class TestSessionFixtureCleanUp(unittest.TestCase):
+    """The session fixture gives its connection back when cleaned up."""
+
+    def setUp(self):
+        super().setUp()
+        self.resource = DatabaseResource(
+            ModelBase,
+            "dbtesttools.tests.models",
+            engine_fixture_name="SqliteMemoryFixture",
+            future=True,
+        )
+        self.database = self.resource.getResource()
+        self.checked_out = 0
+        pool = self.database.engine.pool
+        sa.event.listen(pool, "checkout", self.on_checkout)
+        sa.event.listen(pool, "checkin", self.on_checkin)
+
+    def on_checkout(self, *args):
+        self.checked_out += 1
+
+    def on_checkin(self, *args):
+        self.checked_out -= 1
+
+    def set_up_session(self):
+        session_fixture = SessionFixture(self.database, future=True)
+        session_fixture.setUp()
+        self.assertEqual(self.checked_out, 1)
+        return session_fixture
+
+    def test_connection_returned(self):
+        session_fixture = self.set_up_session()
+        session_fixture.cleanUp()
+        self.assertEqual(self.checked_out, 0)
+        self.resource.finishedWith(self.database)
+
+    def test_connection_returned_after_database_cleaned_up(self):
+        session_fixture = self.set_up_session()
+        # Outside an OptimisingTestSuite, testresources cleans up the
+        # database before the session fixture.
+        self.resource.finishedWith(self.database)
+        session_fixture.cleanUp()
+        self.assertEqual(self.checked_out, 0)
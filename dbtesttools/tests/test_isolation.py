@@ -1,20 +1,69 @@
+import os
+import shutil
+import unittest
+
+import fixtures
 import testresources
 import testscenarios
-import testtools
-from sqlalchemy import func
+from sqlalchemy import insert, select, text
 
 from dbtesttools.fixtures import DatabaseResource, SessionFixture
-from dbtesttools.tests.models import ModelBase, TestModel
+from dbtesttools.tests.models import (
+    ModelBase,
+    OtherModel,
+    OtherModelBase,
+    TestModel,
+)
+
+
+class DBTestCaseSqlite(
+    testresources.ResourcedTestCase,
+    fixtures.TestWithFixtures,
+    unittest.TestCase,
+):
+    db_fixture = DatabaseResource(
+        ModelBase,
+        "dbtesttools.tests.models",
+        engine_fixture_name="SqliteMemoryFixture",
+        future=True,
+    )
+    resources = [("database", db_fixture)]
+
+    def setUp(self):
+        super().setUp()
+        self.session_fixture = SessionFixture(self.database, future=True)
+        self.useFixture(self.session_fixture)
+        self.session = self.session_fixture.session
+
+
+# Both of these resources use the same named SQLite database, each with
+# its own tables.
+SHARED_SQLITE_KWARGS = {"sqlite_name": "dbtesttools-shared"}
 
 
-class DBTestCaseSqlite(testresources.ResourcedTestCase, testtools.TestCase):
+class DBTestCaseSqliteShared(
+    testresources.ResourcedTestCase,
+    fixtures.TestWithFixtures,
+    unittest.TestCase,
+):
     db_fixture = DatabaseResource(
         ModelBase,
         "dbtesttools.tests.models",
         engine_fixture_name="SqliteMemoryFixture",
+        engine_fixture_kwargs=dict(SHARED_SQLITE_KWARGS),
         future=True,
     )
-    resources = [("database", db_fixture)]
+    other_db_fixture = DatabaseResource(
+        OtherModelBase,
+        "dbtesttools.tests.models",
+        engine_fixture_name="SqliteMemoryFixture",
+        engine_fixture_kwargs=dict(SHARED_SQLITE_KWARGS),
+        future=True,
+    )
+    resources = [
+        ("database", db_fixture),
+        ("other_database", other_db_fixture),
+    ]
 
     def setUp(self):
         super().setUp()
@@ -23,7 +72,11 @@ class DBTestCaseSqlite(testresources.ResourcedTestCase, testtools.TestCase):
         self.session = self.session_fixture.session
 
 
-class DBTestCasePostgres(testresources.ResourcedTestCase, testtools.TestCase):
+class DBTestCasePostgres(
+    testresources.ResourcedTestCase,
+    fixtures.TestWithFixtures,
+    unittest.TestCase,
+):
     db_fixture = DatabaseResource(
         ModelBase,
         "dbtesttools.tests.models",
@@ -39,102 +92,107 @@ class DBTestCasePostgres(testresources.ResourcedTestCase, testtools.TestCase):
         self.session = self.session_fixture.session
 
 
+# The ephemeral fixture runs the Postgres programs installed on this host,
+# and Postgres won't run as root.
+CAN_RUN_POSTGRES = (
+    shutil.which("initdb", path=os.getenv("DBTESTTOOLS_PG_BIN_DIR"))
+    is not None
+    and os.geteuid() != 0
+)
+
+
+@unittest.skipUnless(CAN_RUN_POSTGRES, "needs initdb and a non-root user")
+class DBTestCaseEphemeral(
+    testresources.ResourcedTestCase,
+    fixtures.TestWithFixtures,
+    unittest.TestCase,
+):
+    db_fixture = DatabaseResource(
+        ModelBase,
+        "dbtesttools.tests.models",
+        engine_fixture_name="PostgresEphemeralFixture",
+        future=True,
+    )
+    # OptimisingTestSuite sets up resources even for skipped tests.
+    resources = [("database", db_fixture)] if CAN_RUN_POSTGRES else []
+
+    def setUp(self):
+        super().setUp()
+        self.session_fixture = SessionFixture(self.database, future=True)
+        self.useFixture(self.session_fixture)
+        self.session = self.session_fixture.session
+
+
 # Use Scenarios to force a big list of tests to run that will re-use a single
-# DB resource. This relies on a limited concurrency setting in
-# pyproject.toml's scripts.py3 args for stestr.
-
-
-class TestIsolationSqlite(testscenarios.TestWithScenarios, DBTestCaseSqlite):
-    scenarios = [
-        ("1", dict()),
-        ("2", dict()),
-        ("3", dict()),
-        ("4", dict()),
-        ("5", dict()),
-        ("6", dict()),
-        ("7", dict()),
-        ("8", dict()),
-        ("9", dict()),
-        ("10", dict()),
-        ("11", dict()),
-        ("12", dict()),
-        ("13", dict()),
-        ("14", dict()),
-        ("15", dict()),
-        ("16", dict()),
-        ("17", dict()),
-        ("18", dict()),
-        ("19", dict()),
-        ("20", dict()),
-        ("21", dict()),
-        ("22", dict()),
-        ("23", dict()),
-        ("24", dict()),
-        ("25", dict()),
-        ("26", dict()),
-        ("27", dict()),
-        ("28", dict()),
-        ("29", dict()),
-        ("30", dict()),
-    ]
+# DB resource in each test worker.
+SCENARIOS = [(str(i), {}) for i in range(1, 31)]
 
-    def test_isolation_1(self):
-        self.assertEqual(self.session.scalar(func.count(TestModel.id)), 0)
-        self.session.add(TestModel(name="test", value=1))
+# These are built once rather than in every test. Plain SQL also skips
+# compiling the query on every call.
+COUNT_SQL = text(
+    "SELECT count(id) FROM {}".format(TestModel.__tablename__)  # noqa: S608
+)
+INSERT = insert(TestModel)
+
+
+class IsolationTests:
+    """Identical tests that fail if they see data from any other test."""
+
+    def count(self):
+        return self.session.execute(COUNT_SQL).scalar_one()
+
+    def assert_isolated_insert(self):
+        self.assertEqual(self.count(), 0)
+        self.session.execute(INSERT, [dict(name="test", value=1)])
         self.session.commit()
-        self.assertEqual(self.session.scalar(func.count(TestModel.id)), 1)
+        self.assertEqual(self.count(), 1)
+
+    def test_isolation_1(self):
+        self.assert_isolated_insert()
 
     def test_isolation_2(self):
-        self.assertEqual(self.session.scalar(func.count(TestModel.id)), 0)
-        self.session.add(TestModel(name="test", value=1))
-        self.session.commit()
-        self.assertEqual(self.session.scalar(func.count(TestModel.id)), 1)
+        self.assert_isolated_insert()
+
+
+class TestIsolationSqlite(
+    IsolationTests, testscenarios.TestWithScenarios, DBTestCaseSqlite
+):
+    scenarios = SCENARIOS
+
+
+class TestIsolationSqliteShared(
+    IsolationTests, testscenarios.TestWithScenarios, DBTestCaseSqliteShared
+):
+    """A database shared by name is emptied, not restored, between tests."""
+
+    scenarios = SCENARIOS
+
+    def test_reset_keeps_other_fixtures_data(self):
+        other_engine = self.other_database.engine
+        with other_engine.begin() as connection:
+            connection.execute(insert(OtherModel), [dict(name=self.id())])
+        self.assert_isolated_insert()
+
+        # Reset the database, as is done at the end of every test.
+        self.session.close()
+        self.database.rollback_transaction(self.session_fixture.txn)
+
+        with other_engine.connect() as connection:
+            # Rows left by earlier tests are kept too.
+            self.assertIn(
+                self.id(),
+                connection.execute(select(OtherModel.name)).scalars().all(),
+            )
+            self.assertEqual(connection.execute(COUNT_SQL).scalar_one(), 0)
 
 
 class TestIsolationPostrgres(
-    testscenarios.TestWithScenarios, DBTestCasePostgres
+    IsolationTests, testscenarios.TestWithScenarios, DBTestCasePostgres
 ):
-    scenarios = [
-        ("1", dict()),
-        ("2", dict()),
-        ("3", dict()),
-        ("4", dict()),
-        ("5", dict()),
-        ("6", dict()),
-        ("7", dict()),
-        ("8", dict()),
-        ("9", dict()),
-        ("10", dict()),
-        ("11", dict()),
-        ("12", dict()),
-        ("13", dict()),
-        ("14", dict()),
-        ("15", dict()),
-        ("16", dict()),
-        ("17", dict()),
-        ("18", dict()),
-        ("19", dict()),
-        ("20", dict()),
-        ("21", dict()),
-        ("22", dict()),
-        ("23", dict()),
-        ("24", dict()),
-        ("25", dict()),
-        ("26", dict()),
-        ("27", dict()),
-        ("28", dict()),
-        ("29", dict()),
-        ("30", dict()),
-    ]
+    scenarios = SCENARIOS
 
-    def test_isolation_1(self):
-        self.assertEqual(self.session.scalar(func.count(TestModel.id)), 0)
-        self.session.add(TestModel(name="test", value=1))
-        self.session.commit()
-        self.assertEqual(self.session.scalar(func.count(TestModel.id)), 1)
 
-    def test_isolation_2(self):
-        self.assertEqual(self.session.scalar(func.count(TestModel.id)), 0)
-        self.session.add(TestModel(name="test", value=1))
-        self.session.commit()
-        self.assertEqual(self.session.scalar(func.count(TestModel.id)), 1)
+class TestIsolationEphemeral(
+    IsolationTests, testscenarios.TestWithScenarios, DBTestCaseEphemeral
+):
+    scenarios = SCENARIOS
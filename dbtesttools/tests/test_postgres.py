@@ -0,0 +1,60 @@
+import concurrent.futures
+import unittest
+
+from sqlalchemy import text
+
+from dbtesttools.engines.postgres import PostgresEphemeralFixture
+from dbtesttools.tests.test_isolation import CAN_RUN_POSTGRES
+
+# Every fixture's database should start with this table and row, copied
+# from the template.
+INIT_SQL = """
+GRANT ALL ON SCHEMA public TO testing;
+CREATE TABLE prewarmed (name text);
+INSERT INTO prewarmed VALUES ('template');
+GRANT ALL ON prewarmed TO testing;
+"""
+
+SELECT_NAMES = text("SELECT name FROM prewarmed ORDER BY name")
+
+
+@unittest.skipUnless(CAN_RUN_POSTGRES, "needs initdb and a non-root user")
+class TestPrewarm(unittest.TestCase):
+    def set_up_fixtures(self, count):
+        """Set up `count` fixtures concurrently."""
+        dbs = [
+            PostgresEphemeralFixture(init_sql=INIT_SQL, future=True)
+            for _ in range(count)
+        ]
+        futures = [db.setUp_async() for db in dbs]
+        concurrent.futures.wait(futures)
+        for db, future in zip(dbs, futures):
+            if future.exception() is None:
+                self.addCleanup(db.cleanUp)
+        for future in futures:
+            future.result()
+        return dbs
+
+    def names(self, db):
+        with db.engine.connect() as connection:
+            return connection.execute(SELECT_NAMES).scalars().all()
+
+    def test_fixtures_copy_the_prewarmed_template(self):
+        PostgresEphemeralFixture.prewarm(
+            init_sql=INIT_SQL, future=True
+        ).result()
+        dbs = self.set_up_fixtures(3)
+
+        shared = dbs[0].shared
+        self.assertIn(INIT_SQL, shared.templates)
+        for db in dbs:
+            self.assertIs(db.shared, shared)
+            self.assertEqual(self.names(db), ["template"])
+        self.assertEqual(len({db.db_name for db in dbs}), len(dbs))
+
+        # Each database is a copy, not the template itself.
+        with dbs[0].engine.begin() as connection:
+            connection.execute(text("INSERT INTO prewarmed VALUES ('own')"))
+        self.assertEqual(self.names(dbs[0]), ["own", "template"])
+        for db in dbs[1:]:
+            self.assertEqual(self.names(db), ["template"])